@@ -6,12 +6,19 @@ Seattle City Light Portfolio Project
 This script loads all shapefiles and validates:
 - CRS consistency across layers
 - Row counts and column names
-- Geometry validity
+- Geometry validity (with --validate)
+
+It also converts each shapefile to a spatially indexed GeoPackage in
+data/cache, which the downstream scripts read instead of the raw files.
 """
 
-import geopandas as gpd
+import argparse
+import os
+import pyogrio
+import shapely
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # =============================================================================
 # Configuration
@@ -19,24 +26,36 @@ from datetime import datetime
 
 PROJECT_ROOT = Path(__file__).parent.parent
 RAW_DATA_DIR = PROJECT_ROOT / "data" / "raw"
+CACHE_DIR = PROJECT_ROOT / "data" / "cache"
 DOCS_DIR = PROJECT_ROOT / "docs"
 
-# Shapefile paths (using actual folder names)
+# Shapefile paths (using actual folder names) and the attribute columns the
+# pipeline uses from each layer (None = all columns). 02_prep_data.py reads
+# its layers through this table as well.
 DATA_PATHS = {
-    "tree_canopy": RAW_DATA_DIR / "TreeCanopy_Seattle_2021_-5593313463288605630" / "TreeCanopy_2021_Seattle.shp",
-    "city_light_lines": RAW_DATA_DIR / "Seattle_City_Light_Lines_-5298229565165338530" / "Seattle_City_Light_Lines.shp",
-    "city_light_poles": RAW_DATA_DIR / "Seattle_City_Light_Poles_8609399433741543208" / "SCL_Poles.shp",
-    "fire_stations": RAW_DATA_DIR / "Fire_Stations_4483352705992436260" / "Fire_Station.shp",
-    "hospitals": RAW_DATA_DIR / "Hospital_-319877742627952756" / "Hospital.shp",
-    "neighborhoods": RAW_DATA_DIR / "Neighborhood_Map_Atlas_Neighborhoods" / "Neighborhood_Map_Atlas_Neighborhoods.shp",
+    "tree_canopy": (RAW_DATA_DIR / "TreeCanopy_Seattle_2021_-5593313463288605630" / "TreeCanopy_2021_Seattle.shp", []),
+    "city_light_lines": (RAW_DATA_DIR / "Seattle_City_Light_Lines_-5298229565165338530" / "Seattle_City_Light_Lines.shp", None),
+    "city_light_poles": (RAW_DATA_DIR / "Seattle_City_Light_Poles_8609399433741543208" / "SCL_Poles.shp", None),
+    "fire_stations": (RAW_DATA_DIR / "Fire_Stations_4483352705992436260" / "Fire_Station.shp", ["STNID"]),
+    "hospitals": (RAW_DATA_DIR / "Hospital_-319877742627952756" / "Hospital.shp", ["FACILITY"]),
+    "neighborhoods": (RAW_DATA_DIR / "Neighborhood_Map_Atlas_Neighborhoods" / "Neighborhood_Map_Atlas_Neighborhoods.shp", ["L_HOOD", "S_HOOD"]),
 }
 
+# Shapefile component files read by GDAL
+SHAPEFILE_SIDECARS = [".shp", ".shx", ".dbf", ".prj"]
+
 # =============================================================================
 # Functions
 # =============================================================================
 
-def load_and_check_layer(name: str, path: Path) -> dict:
-    """Load a shapefile and return diagnostic information."""
+def load_and_check_layer(name: str, path: Path, columns: list = None,
+                         validate: bool = False) -> dict:
+    """
+    Load a shapefile and return diagnostic information.
+
+    Null/invalid geometry checks decode every feature, so they only run when
+    validate is True.
+    """
     print(f"\n{'='*60}")
     print(f"Loading: {name}")
     print(f"{'='*60}")
@@ -49,81 +68,184 @@ def load_and_check_layer(name: str, path: Path) -> dict:
         print(f"  ERROR: File not found!")
         return info
 
-    # Load the shapefile
+    # Read layer metadata (row count, CRS, fields) without decoding features
     try:
-        gdf = gpd.read_file(path)
+        layer_info = pyogrio.read_info(path)
     except Exception as e:
         info["issues"].append(f"LOAD ERROR: {e}")
         print(f"  ERROR: Could not load file - {e}")
         return info
 
     # Basic info
-    info["row_count"] = len(gdf)
-    info["crs"] = str(gdf.crs) if gdf.crs else "None"
-    info["columns"] = list(gdf.columns)
-    info["geometry_type"] = gdf.geometry.geom_type.unique().tolist()
+    info["row_count"] = layer_info["features"]
+    info["crs"] = layer_info["crs"] or "None"
+    info["columns"] = list(layer_info["fields"]) + ["geometry"]
+    info["geometry_type"] = [layer_info["geometry_type"]]
+
+    # Geometry checks need every feature decoded, so only run them on request
+    if validate:
+        try:
+            gdf = pyogrio.read_dataframe(path, columns=[], use_arrow=True)
+        except Exception as e:
+            info["issues"].append(f"LOAD ERROR: {e}")
+            print(f"  ERROR: Could not load file - {e}")
+            return info
+
+        geoms = gdf.geometry.to_numpy()
+        info["geometry_type"] = gdf.geometry.geom_type.dropna().unique().tolist()
+
+        # Null and validity checks in one vectorized pass each
+        # (is_valid is False for missing geometries, so exclude them)
+        is_null = shapely.is_missing(geoms)
+        null_count = is_null.sum()
+        invalid_count = (~shapely.is_valid(geoms) & ~is_null).sum()
 
     print(f"  Rows: {info['row_count']:,}")
     print(f"  CRS: {info['crs']}")
     print(f"  Geometry type(s): {info['geometry_type']}")
     print(f"  Columns: {info['columns']}")
 
-    # Check for invalid geometries
-    invalid_count = (~gdf.geometry.is_valid).sum()
-    if invalid_count > 0:
-        info["issues"].append(f"Invalid geometries: {invalid_count}")
-        print(f"  WARNING: {invalid_count} invalid geometries found")
+    if validate:
+        # Check for invalid geometries
+        if invalid_count > 0:
+            info["issues"].append(f"Invalid geometries: {invalid_count}")
+            print(f"  WARNING: {invalid_count} invalid geometries found")
 
-    # Check for null geometries
-    null_count = gdf.geometry.isna().sum()
-    if null_count > 0:
-        info["issues"].append(f"Null geometries: {null_count}")
-        print(f"  WARNING: {null_count} null geometries found")
+        # Check for null geometries
+        if null_count > 0:
+            info["issues"].append(f"Null geometries: {null_count}")
+            print(f"  WARNING: {null_count} null geometries found")
+    else:
+        print("  Geometry validity: not checked (run with --validate)")
 
     # Check CRS
-    if gdf.crs is None:
+    if layer_info["crs"] is None:
         info["issues"].append("No CRS defined")
         print(f"  WARNING: No CRS defined!")
 
-    # Sample of first few rows (non-geometry columns)
-    non_geom_cols = [c for c in gdf.columns if c != 'geometry']
-    if non_geom_cols:
+    # Sample of first few rows (columns used by the pipeline)
+    sample_cols = list(layer_info["fields"]) if columns is None else columns
+    if sample_cols:
+        sample = pyogrio.read_dataframe(path, columns=sample_cols,
+                                        read_geometry=False, max_features=3)
         print(f"\n  Sample data (first 3 rows):")
-        print(gdf[non_geom_cols].head(3).to_string(index=False))
+        print(sample.to_string(index=False))
 
     return info
 
 
-def write_process_log(results: list, log_path: Path):
-    """Write results to process log."""
+def prefetch_layer(path: Path):
+    """
+    Ask the OS to read a shapefile's sidecar files into the page cache.
+
+    posix_fadvise(WILLNEED) only starts readahead and returns immediately.
+    It is a no-op on platforms without it (e.g. Windows).
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    for ext in SHAPEFILE_SIDECARS:
+        sidecar = path.with_suffix(ext)
+        if not sidecar.exists():
+            continue
+        fd = os.open(sidecar, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+
+def cache_is_current(cache_path: Path, source_path: Path, columns: list = None) -> bool:
+    """
+    Return True if cache_path exists, is newer than source_path and its
+    shapefile components (attributes live in the .dbf, not the .shp), and
+    holds exactly the given attribute columns (None = all of the source's).
+    A cache whose source is missing counts as current.
+    """
+    if not cache_path.exists():
+        return False
+
+    candidates = [source_path] + [source_path.with_suffix(ext) for ext in SHAPEFILE_SIDECARS]
+    sources = [path for path in candidates if path.exists()]
+    if not sources:
+        return True
+    if cache_path.stat().st_mtime < max(path.stat().st_mtime for path in sources):
+        return False
+
+    # A changed column list in DATA_PATHS also invalidates the cache
+    expected = pyogrio.read_info(source_path)["fields"] if columns is None else columns
+    return set(pyogrio.read_info(cache_path)["fields"]) == set(expected)
+
+
+def _ensure_gpkg(name: str, path: Path, columns: list = None) -> Path:
+    """
+    Convert a raw shapefile to a GeoPackage in data/cache.
+
+    The GeoPackage is a single SQLite file with an R-tree spatial index, so
+    downstream reads can push a bbox filter down to GDAL. Only the listed
+    attribute columns are copied. The cache is rebuilt when the shapefile
+    is newer than it or the column list has changed.
+    """
+    cache_path = CACHE_DIR / f"{name}.gpkg"
+    if cache_is_current(cache_path, path, columns):
+        return cache_path
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    gdf = pyogrio.read_dataframe(path, columns=columns, use_arrow=True)
+    pyogrio.write_dataframe(gdf, cache_path, driver="GPKG",
+                            layer_options={"SPATIAL_INDEX": "YES"})
+    print(f"  Cached: {cache_path}")
+
+    return cache_path
+
+
+def write_process_log(results: list, log_path: Path, validate: bool = False):
+    """Write results to process log (built in memory, written in one call)."""
     log_path.parent.mkdir(parents=True, exist_ok=True)
 
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    validity = "checked" if validate else "not checked (run with --validate)"
+
+    def rows(r):
+        return f"{r['row_count']:,}" if "row_count" in r else "N/A"
+
+    # Summary table
+    summary_rows = "\n".join(
+        f"| {r['name']} | {rows(r)} | {r.get('crs', 'N/A')[:30]} | "
+        f"{'; '.join(r['issues']) if r.get('issues') else 'None'} |"
+        for r in results
+    )
+
+    # Per-layer details
+    details = "\n".join(
+        f"#### {r['name']}\n"
+        f"- **Path:** `{r['path']}`\n"
+        f"- **Rows:** {rows(r)}\n"
+        f"- **CRS:** {r.get('crs', 'N/A')}\n"
+        f"- **Geometry:** {r.get('geometry_type', 'N/A')}\n"
+        f"- **Columns:** {r.get('columns', 'N/A')}\n"
+        + (f"- **Issues:** {', '.join(r['issues'])}\n" if r.get("issues") else "")
+        for r in results
+    )
 
-    with open(log_path, "w") as f:
-        f.write("# Process Log - Vegetation Risk Model\n\n")
-        f.write(f"## 01_load_and_check.py\n")
-        f.write(f"**Run time:** {timestamp}\n\n")
-        f.write("### Summary\n\n")
-
-        # Summary table
-        f.write("| Layer | Rows | CRS | Issues |\n")
-        f.write("|-------|------|-----|--------|\n")
-        for r in results:
-            issues = "; ".join(r.get("issues", [])) if r.get("issues") else "None"
-            f.write(f"| {r['name']} | {r.get('row_count', 'N/A'):,} | {r.get('crs', 'N/A')[:30]} | {issues} |\n")
-
-        f.write("\n### Details\n\n")
-        for r in results:
-            f.write(f"#### {r['name']}\n")
-            f.write(f"- **Path:** `{r['path']}`\n")
-            f.write(f"- **Rows:** {r.get('row_count', 'N/A'):,}\n")
-            f.write(f"- **CRS:** {r.get('crs', 'N/A')}\n")
-            f.write(f"- **Geometry:** {r.get('geometry_type', 'N/A')}\n")
-            f.write(f"- **Columns:** {r.get('columns', 'N/A')}\n")
-            if r.get("issues"):
-                f.write(f"- **Issues:** {', '.join(r['issues'])}\n")
-            f.write("\n")
+    log_content = f"""# Process Log - Vegetation Risk Model
+
+## 01_load_and_check.py
+**Run time:** {timestamp}
+
+**Geometry validity:** {validity}
+
+### Summary
+
+| Layer | Rows | CRS | Issues |
+|-------|------|-----|--------|
+{summary_rows}
+
+### Details
+
+{details}
+"""
+    log_path.write_text(log_content)
 
     print(f"\nProcess log written to: {log_path}")
 
@@ -132,7 +254,7 @@ def write_process_log(results: list, log_path: Path):
 # Main
 # =============================================================================
 
-def main():
+def main(validate: bool = False):
     print("\n" + "="*60)
     print("VEGETATION RISK MODEL - DATA VALIDATION")
     print("Seattle City Light Portfolio Project")
@@ -141,12 +263,29 @@ def main():
     results = []
     crs_values = set()
 
-    # Load and check each layer
-    for name, path in DATA_PATHS.items():
-        info = load_and_check_layer(name, path)
-        results.append(info)
-        if info.get("crs") and info["crs"] != "None":
-            crs_values.add(info["crs"])
+    # Load and check each layer, warming the page cache for the next layer
+    # in the background while the current one is processed
+    layers = list(DATA_PATHS.items())
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        if layers:
+            prefetcher.submit(prefetch_layer, layers[0][1][0])
+
+        for i, (name, (path, columns)) in enumerate(layers):
+            if i + 1 < len(layers):
+                prefetcher.submit(prefetch_layer, layers[i + 1][1][0])
+
+            info = load_and_check_layer(name, path, columns, validate)
+            results.append(info)
+            # Only cache layers that loaded; a failed conversion is reported
+            # like a load error instead of aborting the remaining checks
+            if "row_count" in info:
+                try:
+                    _ensure_gpkg(name, path, columns)
+                except Exception as e:
+                    info["issues"].append(f"CACHE ERROR: {e}")
+                    print(f"  ERROR: Could not cache layer - {e}")
+            if info.get("crs") and info["crs"] != "None":
+                crs_values.add(info["crs"])
 
     # Summary
     print("\n" + "="*60)
@@ -179,10 +318,14 @@ def main():
 
     # Write process log
     log_path = DOCS_DIR / "process_log.md"
-    write_process_log(results, log_path)
+    write_process_log(results, log_path, validate)
 
     return results
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Load and validate raw data layers")
+    parser.add_argument("--validate", action="store_true",
+                        help="check every geometry for null/invalid values (slow on tree canopy)")
+    args = parser.parse_args()
+    main(validate=args.validate)
@@ -11,34 +11,54 @@ This script prepares data for analysis:
 """
 
 import geopandas as gpd
+import importlib
+import numpy as np
 import pandas as pd
+import pyogrio
+import shapely
+from pyproj import Transformer
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
 
 # =============================================================================
 # Configuration
 # =============================================================================
 
 PROJECT_ROOT = Path(__file__).parent.parent
-RAW_DATA_DIR = PROJECT_ROOT / "data" / "raw"
+CACHE_DIR = PROJECT_ROOT / "data" / "cache"
 PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 DOCS_DIR = PROJECT_ROOT / "docs"
 
 # Target CRS - Washington North State Plane (US Feet)
 TARGET_CRS = "EPSG:2926"
 
-# Shapefile paths
-DATA_PATHS = {
-    "city_light_lines": RAW_DATA_DIR / "Seattle_City_Light_Lines_-5298229565165338530" / "Seattle_City_Light_Lines.shp",
-    "fire_stations": RAW_DATA_DIR / "Fire_Stations_4483352705992436260" / "Fire_Station.shp",
-    "hospitals": RAW_DATA_DIR / "Hospital_-319877742627952756" / "Hospital.shp",
-    "neighborhoods": RAW_DATA_DIR / "Neighborhood_Map_Atlas_Neighborhoods" / "Neighborhood_Map_Atlas_Neighborhoods.shp",
-}
+# Shapefile paths and the attribute columns read from each layer are defined
+# once in 01_load_and_check.py (a digit-leading module name needs importlib)
+load_and_check = importlib.import_module("01_load_and_check")
+DATA_PATHS = load_and_check.DATA_PATHS
 
 # =============================================================================
 # Functions
 # =============================================================================
 
+def resolve_source(name: str) -> Path:
+    """
+    Prefer the GeoPackage cache written by 01_load_and_check.py over the raw
+    shapefile, unless the shapefile or its column list has changed since the
+    cache was built.
+    """
+    source_path, columns = DATA_PATHS[name]
+    cache_path = CACHE_DIR / f"{name}.gpkg"
+    return cache_path if load_and_check.cache_is_current(cache_path, source_path, columns) else source_path
+
+
+def read_layer(name: str) -> gpd.GeoDataFrame:
+    """Read a layer, decoding only the attribute columns listed in DATA_PATHS."""
+    columns = DATA_PATHS[name][1]
+    return pyogrio.read_dataframe(resolve_source(name), columns=columns, use_arrow=True)
+
+
 def filter_overhead_lines(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """
     Filter power lines to overhead only.
@@ -51,8 +71,16 @@ def filter_overhead_lines(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
 
     # Check available values
     if 'ConductorT' in gdf.columns:
-        print(f"  ConductorT values: {gdf['ConductorT'].unique()}")
-        overhead = gdf[gdf['ConductorT'] == 'OH'].copy()
+        # Categorical codes turn the filter into an integer comparison
+        conductor = gdf['ConductorT'].astype('category')
+        categories = conductor.cat.categories
+        print(f"  ConductorT values: {categories.tolist()}")
+        if 'OH' in categories:
+            mask = conductor.cat.codes.to_numpy() == categories.get_loc('OH')
+        else:
+            mask = np.zeros(len(gdf), dtype=bool)
+        # take() already returns new data, so no extra .copy() is needed
+        overhead = gdf.take(np.flatnonzero(mask))
     else:
         print("  WARNING: ConductorT column not found, using all lines")
         overhead = gdf.copy()
@@ -60,12 +88,9 @@ def filter_overhead_lines(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     print(f"  Filtered count: {len(overhead):,}")
     print(f"  Removed: {len(gdf) - len(overhead):,} underground/other lines")
 
-    # Add unique segment ID
-    overhead = overhead.reset_index(drop=True)
-    overhead['segment_id'] = range(len(overhead))
-
-    # Calculate segment length (CRS is in feet)
-    overhead['length_ft'] = overhead.geometry.length
+    # Add unique segment ID (cheap RangeIndex swap instead of reset_index)
+    overhead.index = pd.RangeIndex(len(overhead))
+    overhead['segment_id'] = np.arange(len(overhead), dtype=np.int32)
 
     return overhead
 
@@ -77,15 +102,17 @@ def create_critical_facilities(fire_stations: gpd.GeoDataFrame,
     """
     print("\nCreating critical facilities layer...")
 
-    # Prepare fire stations
-    fs = fire_stations[['geometry']].copy()
-    fs['facility_type'] = 'fire_station'
-    fs['facility_name'] = fire_stations['STNID'] if 'STNID' in fire_stations.columns else 'Fire Station'
+    # Prepare fire stations (plain arrays - no copy or index alignment needed)
+    fs = gpd.GeoDataFrame({
+        'facility_type': 'fire_station',
+        'facility_name': fire_stations['STNID'].to_numpy() if 'STNID' in fire_stations.columns else 'Fire Station',
+    }, index=pd.RangeIndex(len(fire_stations)), geometry=fire_stations.geometry.to_numpy(), crs=fire_stations.crs)
 
     # Prepare hospitals
-    hosp = hospitals[['geometry']].copy()
-    hosp['facility_type'] = 'hospital'
-    hosp['facility_name'] = hospitals['FACILITY'] if 'FACILITY' in hospitals.columns else 'Hospital'
+    hosp = gpd.GeoDataFrame({
+        'facility_type': 'hospital',
+        'facility_name': hospitals['FACILITY'].to_numpy() if 'FACILITY' in hospitals.columns else 'Hospital',
+    }, index=pd.RangeIndex(len(hospitals)), geometry=hospitals.geometry.to_numpy(), crs=hospitals.crs)
 
     # Combine
     critical = pd.concat([fs, hosp], ignore_index=True)
@@ -98,6 +125,37 @@ def create_critical_facilities(fire_stations: gpd.GeoDataFrame,
     return critical
 
 
+@lru_cache(maxsize=None)
+def get_transformer(source_crs_wkt: str) -> Transformer:
+    """Build the PROJ pipeline from a source CRS to TARGET_CRS (once per source CRS)."""
+    return Transformer.from_crs(source_crs_wkt, TARGET_CRS, always_xy=True)
+
+
+def reproject(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Reproject to TARGET_CRS using a cached Transformer.
+
+    All layers share the same source CRS, so the PROJ pipeline is built once
+    and each layer's coordinates go through it in one vectorized call.
+    Z values are transformed along with XY for 3D geometries (as to_crs does).
+    """
+    transformer = get_transformer(gdf.crs.to_wkt())
+
+    def transform_coords(coords: np.ndarray) -> np.ndarray:
+        # (N, 2) or (N, 3) in, same shape out
+        return np.column_stack(transformer.transform(*coords.T))
+
+    geoms = gdf.geometry.to_numpy().copy()
+    has_z = shapely.has_z(geoms)
+    geoms[~has_z] = shapely.transform(geoms[~has_z], transform_coords)
+    if has_z.any():
+        geoms[has_z] = shapely.transform(geoms[has_z], transform_coords, include_z=True)
+
+    gdf = gdf.copy()
+    gdf[gdf.geometry.name] = geoms
+    return gdf.set_crs(TARGET_CRS, allow_override=True)
+
+
 def standardize_crs(gdf: gpd.GeoDataFrame, name: str) -> gpd.GeoDataFrame:
     """Ensure GeoDataFrame uses target CRS."""
     if gdf.crs is None:
@@ -105,7 +163,7 @@ def standardize_crs(gdf: gpd.GeoDataFrame, name: str) -> gpd.GeoDataFrame:
         gdf = gdf.set_crs(TARGET_CRS)
     elif gdf.crs.to_string() != TARGET_CRS:
         print(f"  {name}: Reprojecting to {TARGET_CRS}")
-        gdf = gdf.to_crs(TARGET_CRS)
+        gdf = reproject(gdf)
     else:
         print(f"  {name}: CRS OK")
     return gdf
@@ -131,20 +189,25 @@ def main():
 
     # Load data
     print("\nLoading data...")
-    lines = gpd.read_file(DATA_PATHS["city_light_lines"])
-    fire_stations = gpd.read_file(DATA_PATHS["fire_stations"])
-    hospitals = gpd.read_file(DATA_PATHS["hospitals"])
-    neighborhoods = gpd.read_file(DATA_PATHS["neighborhoods"])
+    # No bbox filter here: lines outside the neighborhoods are still scored,
+    # and facilities just outside the city still count for proximity
+    lines = read_layer("city_light_lines")
+    fire_stations = read_layer("fire_stations")
+    hospitals = read_layer("hospitals")
+    neighborhoods = read_layer("neighborhoods")
+
+    # Filter to overhead lines first so discarded lines are never reprojected
+    overhead_lines = filter_overhead_lines(lines)
 
     # Standardize CRS
     print("\nStandardizing CRS...")
-    lines = standardize_crs(lines, "city_light_lines")
+    overhead_lines = standardize_crs(overhead_lines, "city_light_lines")
     fire_stations = standardize_crs(fire_stations, "fire_stations")
     hospitals = standardize_crs(hospitals, "hospitals")
     neighborhoods = standardize_crs(neighborhoods, "neighborhoods")
 
-    # Filter to overhead lines
-    overhead_lines = filter_overhead_lines(lines)
+    # Calculate segment length (target CRS is in feet)
+    overhead_lines['length_ft'] = shapely.length(overhead_lines.geometry.to_numpy())
 
     # Create critical facilities layer
     critical_facilities = create_critical_facilities(fire_stations, hospitals)
@@ -160,17 +223,27 @@ def main():
     print("\nExporting to GeoPackage...")
 
     overhead_path = PROCESSED_DIR / "overhead_lines.gpkg"
-    overhead_lines.to_file(overhead_path, driver="GPKG")
+    pyogrio.write_dataframe(overhead_lines, overhead_path, driver="GPKG", use_arrow=True,
+                            layer_options={"SPATIAL_INDEX": "YES"})
     print(f"  Saved: {overhead_path}")
 
     facilities_path = PROCESSED_DIR / "critical_facilities.gpkg"
-    critical_facilities.to_file(facilities_path, driver="GPKG")
+    pyogrio.write_dataframe(critical_facilities, facilities_path, driver="GPKG", use_arrow=True,
+                            layer_options={"SPATIAL_INDEX": "YES"})
     print(f"  Saved: {facilities_path}")
 
     neighborhoods_path = PROCESSED_DIR / "neighborhoods.gpkg"
-    neighborhoods.to_file(neighborhoods_path, driver="GPKG")
+    pyogrio.write_dataframe(neighborhoods, neighborhoods_path, driver="GPKG", use_arrow=True,
+                            layer_options={"SPATIAL_INDEX": "YES"})
     print(f"  Saved: {neighborhoods_path}")
 
+    # GeoParquet copies of the small reference layers for fast, column-pruned
+    # reads by 08_visualize.py
+    for gdf, name in [(critical_facilities, "critical_facilities"), (neighborhoods, "neighborhoods")]:
+        parquet_path = PROCESSED_DIR / f"{name}.parquet"
+        gdf.to_parquet(parquet_path, compression="zstd")
+        print(f"  Saved: {parquet_path}")
+
     # Summary
     print("\n" + "="*60)
     print("SUMMARY")
@@ -197,8 +270,8 @@ def main():
 | Output | Rows | File |
 |--------|------|------|
 | Overhead lines | {len(overhead_lines):,} | overhead_lines.gpkg |
-| Critical facilities | {len(critical_facilities):,} | critical_facilities.gpkg |
-| Neighborhoods | {len(neighborhoods):,} | neighborhoods.gpkg |
+| Critical facilities | {len(critical_facilities):,} | critical_facilities.gpkg (+ .parquet) |
+| Neighborhoods | {len(neighborhoods):,} | neighborhoods.gpkg (+ .parquet) |
 
 Total overhead line length: {overhead_lines['length_ft'].sum() / 5280:.1f} miles
 
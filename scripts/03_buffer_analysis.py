@@ -10,6 +10,8 @@ This script creates buffer zones around overhead power lines:
 """
 
 import geopandas as gpd
+import pyogrio
+import shapely
 from pathlib import Path
 from datetime import datetime
 
@@ -29,12 +31,15 @@ BUFFER_DISTANCE_FT = 15
 # =============================================================================
 
 def repair_geometries(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    """Repair invalid geometries using buffer(0) technique."""
-    invalid_count = (~gdf.geometry.is_valid).sum()
+    """Repair invalid geometries using shapely.make_valid (valid rows are left untouched)."""
+    geoms = gdf.geometry.to_numpy().copy()
+    invalid = ~shapely.is_valid(geoms)
+    invalid_count = invalid.sum()
 
     if invalid_count > 0:
         print(f"  Repairing {invalid_count} invalid geometries...")
-        gdf['geometry'] = gdf.geometry.buffer(0)
+        geoms[invalid] = shapely.make_valid(geoms[invalid])
+        gdf['geometry'] = geoms
 
         # Verify repair
         still_invalid = (~gdf.geometry.is_valid).sum()
@@ -64,7 +69,7 @@ def create_line_buffers(gdf: gpd.GeoDataFrame, buffer_distance: float) -> gpd.Ge
     buffered['geometry'] = gdf.geometry.buffer(buffer_distance)
 
     # Calculate buffer area
-    buffered['buffer_area_sqft'] = buffered.geometry.area
+    buffered['buffer_area_sqft'] = shapely.area(buffered.geometry.to_numpy())
 
     print(f"  Buffered {len(buffered):,} line segments")
     print(f"  Average buffer area: {buffered['buffer_area_sqft'].mean():,.0f} sq ft")
@@ -90,7 +95,7 @@ def main():
     # Load overhead lines
     print("\nLoading overhead lines...")
     lines_path = PROCESSED_DIR / "overhead_lines.gpkg"
-    lines = gpd.read_file(lines_path)
+    lines = pyogrio.read_dataframe(lines_path, use_arrow=True)
     print(f"  Loaded {len(lines):,} line segments")
 
     # Repair any invalid geometries
@@ -105,8 +110,8 @@ def main():
 
     # Export
     print("\nExporting buffered lines...")
-    output_path = PROCESSED_DIR / "line_buffers.gpkg"
-    buffered_lines.to_file(output_path, driver="GPKG")
+    output_path = PROCESSED_DIR / "line_buffers.parquet"
+    buffered_lines.to_parquet(output_path, compression="zstd")
     print(f"  Saved: {output_path}")
 
     # Summary statistics
@@ -139,7 +144,7 @@ def main():
 | Total buffer area | {buffered_lines['buffer_area_sqft'].sum() / 43560:.1f} acres |
 | Avg buffer area | {buffered_lines['buffer_area_sqft'].mean():,.0f} sq ft |
 
-Output: `line_buffers.gpkg`
+Output: `line_buffers.parquet`
 
 """
     update_process_log(DOCS_DIR / "process_log.md", log_content)
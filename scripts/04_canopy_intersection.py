@@ -8,13 +8,20 @@ This script calculates vegetation load for each line segment:
 - Calculates canopy area (sq ft) within each buffer
 - Normalizes by segment length: canopy_sqft_per_linear_ft
 
-Note: This is computationally intensive due to large tree canopy dataset (~400K polygons)
+Note: This is computationally intensive due to large tree canopy dataset (~400K polygons),
+so the intersection is split into chunks and run across all CPU cores.
 """
 
 import geopandas as gpd
+import importlib
+import numpy as np
 import pandas as pd
+import pyogrio
+import shapely
+import os
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 import warnings
 
@@ -26,31 +33,72 @@ warnings.filterwarnings('ignore', category=pd.errors.PerformanceWarning)
 # =============================================================================
 
 PROJECT_ROOT = Path(__file__).parent.parent
-RAW_DATA_DIR = PROJECT_ROOT / "data" / "raw"
+CACHE_DIR = PROJECT_ROOT / "data" / "cache"
 PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 DOCS_DIR = PROJECT_ROOT / "docs"
 
 # Target CRS
 TARGET_CRS = "EPSG:2926"
 
-# Tree canopy path
-CANOPY_PATH = RAW_DATA_DIR / "TreeCanopy_Seattle_2021_-5593313463288605630" / "TreeCanopy_2021_Seattle.shp"
+# Tree canopy path and columns, and the cache staleness rule, come from
+# 01_load_and_check.py (a digit-leading module name needs importlib)
+load_and_check = importlib.import_module("01_load_and_check")
+CANOPY_PATH, CANOPY_COLUMNS = load_and_check.DATA_PATHS["tree_canopy"]
+
+# Spatially indexed copy written by 01_load_and_check.py
+CANOPY_CACHE_PATH = CACHE_DIR / "tree_canopy.gpkg"
+
+# Canopy subdivision - polygons above the vertex limit are clipped to a grid
+SUBDIVIDE_MAX_VERTICES = 256
+SUBDIVIDE_CELL_FT = 500
+
+# Subdivided canopy for the whole city, rebuilt when the source canopy is newer.
+# The subdivision parameters are part of the name, so changing them also
+# triggers a rebuild. FlatGeobuf stores a packed Hilbert R-tree in its header,
+# so bbox reads are cheap.
+SUBDIVIDED_CANOPY_PATH = PROCESSED_DIR / f"canopy_subdivided_{SUBDIVIDE_MAX_VERTICES}v_{SUBDIVIDE_CELL_FT}ft.fgb"
 
 # Processing chunk size (to manage memory)
 CHUNK_SIZE = 5000
 
+# Worker processes for the canopy intersection (one per CPU core)
+N_WORKERS = os.cpu_count() or 1
+
+# Per-worker canopy geometries and spatial index (set by _init_worker)
+_worker_canopy = None
+_worker_tree = None
+
 # =============================================================================
 # Functions
 # =============================================================================
 
-def load_and_prep_canopy(canopy_path: Path) -> gpd.GeoDataFrame:
+def study_area_bbox(gdf: gpd.GeoDataFrame, source_path: Path) -> tuple:
+    """Return the extent of gdf in the CRS of the file at source_path."""
+    source_crs = pyogrio.read_info(source_path)["crs"]
+    extent = gpd.GeoSeries([shapely.box(*gdf.total_bounds)], crs=gdf.crs)
+    return tuple(extent.to_crs(source_crs).total_bounds)
+
+
+def load_and_prep_canopy(canopy_path: Path, extent: gpd.GeoDataFrame = None) -> gpd.GeoDataFrame:
     """
     Load tree canopy data and prepare for analysis.
     - Repair invalid geometries
     - Reproject to target CRS
+    - Subdivide large polygons (cached to SUBDIVIDED_CANOPY_PATH for the full city)
+    - Return only polygons within the bounds of extent (uses the cache's spatial index)
     """
+    # The subdivided canopy holds geometry only (no attribute columns)
+    if load_and_check.cache_is_current(SUBDIVIDED_CANOPY_PATH, canopy_path, columns=[]):
+        print(f"Loading subdivided tree canopy from {SUBDIVIDED_CANOPY_PATH.name}...")
+        bbox = study_area_bbox(extent, SUBDIVIDED_CANOPY_PATH) if extent is not None else None
+        canopy = pyogrio.read_dataframe(SUBDIVIDED_CANOPY_PATH, bbox=bbox, use_arrow=True)
+        print(f"  Loaded {len(canopy):,} canopy polygons")
+        return canopy
+
     print("Loading tree canopy data (this may take a moment)...")
-    canopy = gpd.read_file(canopy_path)
+    # Only the polygons are needed - skip decoding the attribute table.
+    # The cache covers the whole file so it stays valid for any extent.
+    canopy = pyogrio.read_dataframe(canopy_path, columns=[], use_arrow=True)
     print(f"  Loaded {len(canopy):,} canopy polygons")
 
     # Reproject if needed
@@ -58,75 +106,158 @@ def load_and_prep_canopy(canopy_path: Path) -> gpd.GeoDataFrame:
         print(f"  Reprojecting to {TARGET_CRS}...")
         canopy = canopy.to_crs(TARGET_CRS)
 
-    # Repair invalid geometries
-    invalid_count = (~canopy.geometry.is_valid).sum()
+    # Repair invalid geometries (valid polygons are left untouched)
+    geoms = canopy.geometry.to_numpy().copy()
+    invalid = ~shapely.is_valid(geoms)
+    invalid_count = invalid.sum()
     if invalid_count > 0:
         print(f"  Repairing {invalid_count} invalid geometries...")
-        canopy['geometry'] = canopy.geometry.buffer(0)
+        geoms[invalid] = shapely.make_valid(geoms[invalid])
+        canopy['geometry'] = geoms
+
+    # Subdivide once and cache for subsequent runs
+    canopy = subdivide_canopy(canopy)
+    pyogrio.write_dataframe(canopy, SUBDIVIDED_CANOPY_PATH, driver="FlatGeobuf", use_arrow=True,
+                            layer_options={"SPATIAL_INDEX": "YES"})
+    print(f"  Saved: {SUBDIVIDED_CANOPY_PATH}")
+
+    # Same bbox filter the cached read applies
+    if extent is not None:
+        bbox = study_area_bbox(extent, SUBDIVIDED_CANOPY_PATH)
+        canopy = canopy.iloc[np.sort(canopy.sindex.query(shapely.box(*bbox)))].reset_index(drop=True)
+        print(f"  Kept {len(canopy):,} canopy polygons within the study area")
 
     return canopy
 
 
-def calculate_canopy_intersection_chunked(buffers: gpd.GeoDataFrame,
-                                          canopy: gpd.GeoDataFrame,
-                                          chunk_size: int = CHUNK_SIZE) -> gpd.GeoDataFrame:
+def subdivide_canopy(canopy: gpd.GeoDataFrame,
+                     max_vertices: int = SUBDIVIDE_MAX_VERTICES,
+                     cell_size: float = SUBDIVIDE_CELL_FT) -> gpd.GeoDataFrame:
     """
-    Calculate canopy area within each buffer using spatial index and chunked processing.
+    Clip large canopy polygons against a regular grid.
 
-    This approach is more memory-efficient for large datasets.
+    Large polygons have bounding boxes that cover many buffers, so they come
+    back as candidates for most queries and each GEOS intersection against
+    them is expensive. Grid pieces have tight bounding boxes and few vertices.
+    The pieces tile the original polygon, so canopy area is unchanged.
+
+    Args:
+        canopy: GeoDataFrame with canopy polygons (in feet)
+        max_vertices: Polygons with more vertices than this are subdivided
+        cell_size: Grid cell size in CRS units (feet)
+
+    Returns:
+        GeoDataFrame with small polygons kept as-is and large ones split
     """
-    print(f"\nCalculating canopy intersections (chunk size: {chunk_size})...")
+    geoms = canopy.geometry.to_numpy()
+    large = shapely.get_num_coordinates(geoms) > max_vertices
+    print(f"  Subdividing {large.sum():,} polygons with > {max_vertices} vertices "
+          f"({cell_size} ft grid)...")
+    if not large.any():
+        return canopy
+
+    large_geoms = geoms[large]
+
+    # Regular grid covering the large polygons
+    minx, miny, maxx, maxy = shapely.total_bounds(large_geoms)
+    gx, gy = np.meshgrid(np.arange(minx, maxx, cell_size), np.arange(miny, maxy, cell_size))
+    gx, gy = gx.ravel(), gy.ravel()
+    grid = shapely.box(gx, gy, gx + cell_size, gy + cell_size)
 
-    # Build spatial index on canopy
-    print("  Building spatial index on tree canopy...")
-    canopy_sindex = canopy.sindex
+    # Clip each large polygon to every grid cell it touches
+    poly_idx, cell_idx = shapely.STRtree(grid).query(large_geoms, predicate='intersects')
+    pieces = shapely.intersection(large_geoms[poly_idx], grid[cell_idx])
 
-    # Initialize results column
-    canopy_areas = []
+    # Drop slivers where a polygon only touches a cell edge
+    pieces = pieces[shapely.area(pieces) > 0]
 
-    # Process in chunks with progress bar
-    n_chunks = (len(buffers) + chunk_size - 1) // chunk_size
+    subdivided = np.concatenate([geoms[~large], pieces])
+    print(f"  Canopy polygons after subdivision: {len(subdivided):,}")
 
-    for i in tqdm(range(0, len(buffers), chunk_size), desc="Processing buffers", total=n_chunks):
-        chunk = buffers.iloc[i:i+chunk_size]
+    return gpd.GeoDataFrame(geometry=subdivided, crs=canopy.crs)
 
-        for idx, row in chunk.iterrows():
-            buffer_geom = row.geometry
 
-            # Find potentially intersecting canopy polygons using spatial index
-            possible_idx = list(canopy_sindex.intersection(buffer_geom.bounds))
+def _init_worker(canopy_wkb: np.ndarray):
+    """Rebuild canopy geometries and their STRtree inside a worker process."""
+    global _worker_canopy, _worker_tree
+    _worker_canopy = shapely.from_wkb(canopy_wkb)
+    _worker_tree = shapely.STRtree(_worker_canopy)
 
-            if len(possible_idx) == 0:
-                canopy_areas.append(0.0)
-                continue
 
-            # Get candidate polygons
-            candidates = canopy.iloc[possible_idx]
+def _intersect_chunk(buffer_wkb: np.ndarray) -> np.ndarray:
+    """Return the canopy area within each buffer of one chunk."""
+    chunk = shapely.from_wkb(buffer_wkb)
 
-            # Calculate actual intersection area
-            try:
-                intersections = candidates.geometry.intersection(buffer_geom)
-                total_canopy_area = intersections.area.sum()
-                canopy_areas.append(total_canopy_area)
-            except Exception:
-                canopy_areas.append(0.0)
+    # Candidate (buffer, canopy) pairs whose geometries actually intersect
+    buf_idx, can_idx = _worker_tree.query(chunk, predicate='intersects')
+    if len(buf_idx) == 0:
+        return np.zeros(len(chunk), dtype=np.float64)
 
-    return canopy_areas
+    # Intersection area of every pair, summed per buffer
+    intersections = shapely.intersection(chunk[buf_idx], _worker_canopy[can_idx])
+    areas = shapely.area(intersections)
+    return np.bincount(buf_idx, weights=areas, minlength=len(chunk))
 
 
-def main():
+def calculate_canopy_intersection_chunked(buffers: gpd.GeoDataFrame,
+                                          canopy: gpd.GeoDataFrame,
+                                          chunk_size: int = CHUNK_SIZE,
+                                          n_workers: int = N_WORKERS) -> np.ndarray:
+    """
+    Calculate canopy area within each buffer using spatial index and chunked processing.
+
+    Chunks are distributed over a process pool. STRtrees can't be pickled, so
+    the canopy is shipped to each worker once as WKB and the tree is rebuilt
+    there. Within a chunk the work is fully vectorized (STRtree query,
+    shapely.intersection, np.bincount).
+    """
+    print(f"\nCalculating canopy intersections (chunk size: {chunk_size}, workers: {n_workers})...")
+
+    # Serialize geometries once for transfer to the workers
+    canopy_wkb = shapely.to_wkb(canopy.geometry.to_numpy())
+    buffer_wkb = shapely.to_wkb(buffers.geometry.to_numpy())
+    chunks = [buffer_wkb[i:i+chunk_size] for i in range(0, len(buffer_wkb), chunk_size)]
+
+    if n_workers <= 1:
+        print("  Building spatial index on tree canopy...")
+        _init_worker(canopy_wkb)
+        results = [_intersect_chunk(c) for c in tqdm(chunks, desc="Processing buffers")]
+    else:
+        print("  Building spatial index on tree canopy in each worker...")
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=_init_worker,
+                                 initargs=(canopy_wkb,)) as executor:
+            results = list(tqdm(executor.map(_intersect_chunk, chunks),
+                                desc="Processing buffers", total=len(chunks)))
+
+    if not results:
+        return np.zeros(0, dtype=np.float64)
+    return np.concatenate(results)
+
+
+def main(write_output: bool = True):
+    """
+    Run the canopy intersection stage.
+
+    Args:
+        write_output: Save lines_with_canopy.parquet (run_pipeline.py turns this
+            off and hands the returned GeoDataFrame straight to stage 05)
+    """
     print("\n" + "="*60)
     print("04_CANOPY_INTERSECTION - Calculate Vegetation Load")
     print("="*60)
 
     # Load line buffers
     print("\nLoading line buffers...")
-    buffers_path = PROCESSED_DIR / "line_buffers.gpkg"
-    buffers = gpd.read_file(buffers_path)
+    buffers_path = PROCESSED_DIR / "line_buffers.parquet"
+    buffers = gpd.read_parquet(buffers_path)
     print(f"  Loaded {len(buffers):,} buffered segments")
 
-    # Load tree canopy
-    canopy = load_and_prep_canopy(CANOPY_PATH)
+    # Load tree canopy, limited to the extent of the buffers
+    # (the GeoPackage is skipped if the shapefile has changed since 01 built it)
+    use_cache = load_and_check.cache_is_current(CANOPY_CACHE_PATH, CANOPY_PATH, CANOPY_COLUMNS)
+    canopy_path = CANOPY_CACHE_PATH if use_cache else CANOPY_PATH
+    canopy = load_and_prep_canopy(canopy_path, extent=buffers)
 
     # Calculate canopy intersection
     canopy_areas = calculate_canopy_intersection_chunked(buffers, canopy)
@@ -136,16 +267,17 @@ def main():
 
     # Calculate normalized vegetation load
     # canopy_sqft_per_linear_ft = canopy_area / segment_length
-    buffers['canopy_sqft_per_ft'] = buffers['canopy_area_sqft'] / buffers['length_ft']
+    buffers['canopy_sqft_per_ft'] = canopy_areas / buffers['length_ft'].to_numpy()
 
     # Handle any division issues
     buffers['canopy_sqft_per_ft'] = buffers['canopy_sqft_per_ft'].fillna(0)
 
     # Export results
-    print("\nExporting results...")
-    output_path = PROCESSED_DIR / "lines_with_canopy.gpkg"
-    buffers.to_file(output_path, driver="GPKG")
-    print(f"  Saved: {output_path}")
+    if write_output:
+        print("\nExporting results...")
+        output_path = PROCESSED_DIR / "lines_with_canopy.parquet"
+        buffers.to_parquet(output_path, compression="zstd")
+        print(f"  Saved: {output_path}")
 
     # Summary statistics
     print("\n" + "="*60)
@@ -173,7 +305,7 @@ def main():
 **Run time:** {timestamp}
 
 ### Actions
-- Loaded tree canopy data ({len(canopy):,} polygons)
+- Loaded tree canopy data ({len(canopy):,} polygons after subdivision)
 - Calculated canopy area within each 15-foot line buffer
 - Normalized by segment length (canopy_sqft_per_ft)
 
@@ -186,7 +318,7 @@ def main():
 | Mean canopy/ft | {buffers['canopy_sqft_per_ft'].mean():.2f} sq ft/ft |
 | Max canopy/ft | {buffers['canopy_sqft_per_ft'].max():.2f} sq ft/ft |
 
-Output: `lines_with_canopy.gpkg`
+Output: `lines_with_canopy.parquet`
 
 """
     with open(DOCS_DIR / "process_log.md", "a") as f:
@@ -13,9 +13,10 @@ This script calculates proximity to critical facilities:
 
 import geopandas as gpd
 import numpy as np
+import pandas as pd
+import shapely
 from pathlib import Path
 from datetime import datetime
-from tqdm import tqdm
 
 # =============================================================================
 # Configuration
@@ -25,6 +26,9 @@ PROJECT_ROOT = Path(__file__).parent.parent
 PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 DOCS_DIR = PROJECT_ROOT / "docs"
 
+# Planar CRS all distances are measured in (WA State Plane North, feet)
+TARGET_CRS = "EPSG:2926"
+
 # Proximity thresholds (feet)
 PROXIMITY_THRESHOLDS = {
     'high': 500,     # < 500 ft = score 3
@@ -32,26 +36,24 @@ PROXIMITY_THRESHOLDS = {
                      # > 1500 ft = score 1
 }
 
+# Score for each distance band (< high, < medium, beyond)
+PROXIMITY_SCORES = np.array([3, 2, 1], dtype=np.int8)
+
 # =============================================================================
 # Functions
 # =============================================================================
 
-def classify_proximity(distance: float) -> int:
+def ensure_projected(gdf: gpd.GeoDataFrame, name: str) -> gpd.GeoDataFrame:
     """
-    Classify distance into proximity score.
-
-    Args:
-        distance: Distance in feet
-
-    Returns:
-        Score: 3 (high priority), 2 (medium), 1 (low)
+    Make sure gdf is in the planar TARGET_CRS (feet) before any distance or
+    centroid work, reprojecting once up front if it is not.
     """
-    if distance < PROXIMITY_THRESHOLDS['high']:
-        return 3
-    elif distance < PROXIMITY_THRESHOLDS['medium']:
-        return 2
-    else:
-        return 1
+    if gdf.crs is None:
+        raise ValueError(f"{name} has no CRS - rerun 02_prep_data.py")
+    if gdf.crs.is_geographic or gdf.crs.to_string() != TARGET_CRS:
+        print(f"  {name}: Reprojecting to {TARGET_CRS}")
+        gdf = gdf.to_crs(TARGET_CRS)
+    return gdf
 
 
 def calculate_proximity_to_facilities(lines: gpd.GeoDataFrame,
@@ -64,76 +66,83 @@ def calculate_proximity_to_facilities(lines: gpd.GeoDataFrame,
         facilities: GeoDataFrame with critical facility points
 
     Returns:
-        lines GeoDataFrame with added proximity_dist_ft and proximity_score columns
+        lines GeoDataFrame (modified in place) with added cx/cy centroid, proximity_dist_ft and
+        proximity_score columns
     """
     print("\nCalculating proximity to critical facilities...")
 
-    # Get centroids of line segments (or buffer polygons)
-    lines = lines.copy()
-
-    # Calculate centroid once
+    # Calculate centroids of line segments (or buffer polygons) once,
+    # straight off the geometry array
     print("  Calculating segment centroids...")
-    centroids = lines.geometry.centroid
-
-    # Use sjoin_nearest for efficient nearest neighbor calculation
-    print("  Finding nearest facility for each segment...")
+    centroids = shapely.centroid(lines.geometry.to_numpy())
 
-    # Create a temporary GeoDataFrame with centroids
-    centroids_gdf = gpd.GeoDataFrame(
-        {'segment_idx': range(len(centroids))},
-        geometry=centroids,
-        crs=lines.crs
-    )
+    # Persist centroid coordinates so later stages don't recompute them
+    lines['cx'] = shapely.get_x(centroids)
+    lines['cy'] = shapely.get_y(centroids)
 
-    # Use sjoin_nearest to find nearest facility
-    nearest = gpd.sjoin_nearest(
-        centroids_gdf,
-        facilities[['geometry', 'facility_type']],
-        how='left',
-        distance_col='proximity_dist_ft'
+    # Query a facility STRtree for the nearest facility of every centroid at once
+    print("  Finding nearest facility for each segment...")
+    facility_tree = shapely.STRtree(facilities.geometry.to_numpy())
+    (segment_idx, facility_idx), distances = facility_tree.query_nearest(
+        centroids, return_distance=True, all_matches=False
     )
 
-    # Handle any duplicates (take first match)
-    nearest = nearest.drop_duplicates(subset='segment_idx', keep='first')
-    nearest = nearest.sort_values('segment_idx').reset_index(drop=True)
+    # Scatter results back by segment (segments with empty geometry get no match)
+    dist = np.full(len(lines), np.nan)
+    dist[segment_idx] = distances
+    # Facility type is gathered as categorical codes (-1 = no match), so only
+    # the handful of facilities are ever touched as Python strings
+    facility_types = pd.Categorical(facilities['facility_type'])
+    type_codes = np.full(len(lines), -1, dtype=facility_types.codes.dtype)
+    type_codes[segment_idx] = facility_types.codes[facility_idx]
 
     # Add results to lines
-    lines['proximity_dist_ft'] = nearest['proximity_dist_ft'].values
-    lines['nearest_facility_type'] = nearest['facility_type'].values
+    lines['proximity_dist_ft'] = dist
+    lines['nearest_facility_type'] = pd.Categorical.from_codes(type_codes, dtype=facility_types.dtype)
 
-    # Classify proximity scores using vectorized operations
-    lines['proximity_score'] = np.where(
-        lines['proximity_dist_ft'] < PROXIMITY_THRESHOLDS['high'], 3,
-        np.where(lines['proximity_dist_ft'] < PROXIMITY_THRESHOLDS['medium'], 2, 1)
-    )
+    # Classify proximity scores: one digitize pass gives the distance band
+    # (0 = < high, 1 = < medium, 2 = beyond) which indexes the score lookup
+    bins = np.array([PROXIMITY_THRESHOLDS['high'], PROXIMITY_THRESHOLDS['medium']], dtype=np.float64)
+    lines['proximity_score'] = PROXIMITY_SCORES[np.digitize(dist, bins)]
 
     return lines
 
 
-def main():
+def main(lines: gpd.GeoDataFrame = None, write_output: bool = True):
+    """
+    Run the proximity stage.
+
+    Args:
+        lines: Output of stage 04; read from lines_with_canopy.parquet if None
+        write_output: Save lines_with_proximity.parquet
+    """
     print("\n" + "="*60)
     print("05_PROXIMITY_ANALYSIS - Critical Facility Proximity")
     print("="*60)
 
     # Load data
     print("\nLoading data...")
-    lines_path = PROCESSED_DIR / "lines_with_canopy.gpkg"
     facilities_path = PROCESSED_DIR / "critical_facilities.gpkg"
-
-    lines = gpd.read_file(lines_path)
-    facilities = gpd.read_file(facilities_path)
+    if lines is None:
+        lines = gpd.read_parquet(PROCESSED_DIR / "lines_with_canopy.parquet")
+    facilities = gpd.read_file(facilities_path, engine="pyogrio")
 
     print(f"  Loaded {len(lines):,} line segments")
     print(f"  Loaded {len(facilities):,} critical facilities")
 
+    # Distances are only meaningful in feet - check CRS once at load
+    lines = ensure_projected(lines, "Line segments")
+    facilities = ensure_projected(facilities, "Critical facilities")
+
     # Calculate proximity
     lines = calculate_proximity_to_facilities(lines, facilities)
 
     # Export results
-    print("\nExporting results...")
-    output_path = PROCESSED_DIR / "lines_with_proximity.gpkg"
-    lines.to_file(output_path, driver="GPKG")
-    print(f"  Saved: {output_path}")
+    if write_output:
+        print("\nExporting results...")
+        output_path = PROCESSED_DIR / "lines_with_proximity.parquet"
+        lines.to_parquet(output_path, compression="zstd")
+        print(f"  Saved: {output_path}")
 
     # Summary statistics
     print("\n" + "="*60)
@@ -182,7 +191,7 @@ def main():
 - Mean: {lines['proximity_dist_ft'].mean():,.0f} ft
 - Median: {lines['proximity_dist_ft'].median():,.0f} ft
 
-Output: `lines_with_proximity.gpkg`
+Output: `lines_with_proximity.parquet`
 
 """
     with open(DOCS_DIR / "process_log.md", "a") as f:
@@ -14,6 +14,9 @@ This script calculates composite risk scores:
 
 import geopandas as gpd
 import numpy as np
+import pandas as pd
+import pyogrio
+from numba import njit, prange
 from pathlib import Path
 from datetime import datetime
 
@@ -42,39 +45,62 @@ TIER_THRESHOLDS = {
 # Functions
 # =============================================================================
 
-def normalize_min_max(series):
+@njit(cache=True, fastmath=True, parallel=True)
+def compute_risk_scores(veg, prox, length, w_veg, w_prox, w_len):
     """
-    Normalize a series to 0-1 scale using min-max normalization.
-    Handles edge case where all values are the same.
+    Weighted composite risk score in one fused, parallel loop.
+    Vegetation and length are min-max normalized to 0-1 (a constant factor
+    contributes 0); proximity score (3/2/1) is divided by 3.
     """
-    min_val = series.min()
-    max_val = series.max()
+    veg_min = veg.min()
+    veg_range = veg.max() - veg_min
+    len_min = length.min()
+    len_range = length.max() - len_min
 
-    if max_val == min_val:
-        return np.zeros(len(series))
+    veg_scale = w_veg / veg_range if veg_range > 0 else 0.0
+    len_scale = w_len / len_range if len_range > 0 else 0.0
+    prox_scale = w_prox / 3.0
 
-    return (series - min_val) / (max_val - min_val)
+    out = np.empty(veg.size, dtype=np.float32)
+    for i in prange(veg.size):
+        out[i] = ((veg[i] - veg_min) * veg_scale +
+                  prox[i] * prox_scale +
+                  (length[i] - len_min) * len_scale)
+    return out
 
 
-def classify_risk_tier(score, high_threshold, medium_threshold):
-    """Classify risk score into tier."""
-    if score >= high_threshold:
-        return 'High'
-    elif score >= medium_threshold:
-        return 'Medium'
-    else:
-        return 'Low'
+def percentiles_partitioned(values: np.ndarray, percents: list) -> list:
+    """
+    Linear-interpolated percentiles (same as np.percentile's default) from a
+    single np.partition call covering every percentile requested.
+    """
+    n = len(values)
+    positions = [p / 100 * (n - 1) for p in percents]
+    lower = [int(np.floor(pos)) for pos in positions]
+    upper = [min(lo + 1, n - 1) for lo in lower]
+    part = np.partition(values, sorted(set(lower + upper)))
+
+    return [
+        float(part[lo]) + (float(part[hi]) - float(part[lo])) * (pos - lo)
+        for pos, lo, hi in zip(positions, lower, upper)
+    ]
 
 
-def main():
+def main(lines: gpd.GeoDataFrame = None):
+    """
+    Run the risk scoring stage.
+
+    Args:
+        lines: Output of stage 05; read from lines_with_proximity.parquet if None
+    """
     print("\n" + "="*60)
     print("06_RISK_SCORING - Calculate Composite Risk Scores")
     print("="*60)
 
     # Load data with all metrics
     print("\nLoading data...")
-    lines_path = PROCESSED_DIR / "lines_with_proximity.gpkg"
-    lines = gpd.read_file(lines_path)
+    if lines is None:
+        lines = gpd.read_parquet(PROCESSED_DIR / "lines_with_proximity.parquet")
     print(f"  Loaded {len(lines):,} line segments")
 
     # Verify required columns exist
@@ -84,68 +110,79 @@ def main():
             raise ValueError(f"Missing required column: {col}")
     print(f"  Required columns verified: {required_cols}")
 
-    # ==========================================================================
-    # Step 1: Normalize each factor to 0-1 scale
-    # ==========================================================================
-    print("\nNormalizing risk factors...")
-
-    # Vegetation load (canopy per linear foot) - higher = more risk
-    lines['veg_norm'] = normalize_min_max(lines['canopy_sqft_per_ft'])
-    print(f"  Vegetation: min={lines['veg_norm'].min():.3f}, max={lines['veg_norm'].max():.3f}")
-
-    # Proximity score (3/2/1) - already scored, just normalize to 0-1
-    # Score 3 = highest priority, normalize so 3 -> 1.0, 1 -> 0.33
-    lines['prox_norm'] = lines['proximity_score'] / 3
-    print(f"  Proximity: min={lines['prox_norm'].min():.3f}, max={lines['prox_norm'].max():.3f}")
-
-    # Segment length - longer = more exposure = higher risk
-    lines['length_norm'] = normalize_min_max(lines['length_ft'])
-    print(f"  Length: min={lines['length_norm'].min():.3f}, max={lines['length_norm'].max():.3f}")
+    # Downcast metrics - float32 / int8 is ample for percentile binning and display
+    for col in ['canopy_sqft_per_ft', 'length_ft']:
+        lines[col] = lines[col].astype(np.float32)
+    lines['proximity_score'] = lines['proximity_score'].astype(np.int8)
 
     # ==========================================================================
-    # Step 2: Calculate weighted composite risk score
+    # Step 1: Normalize each factor and combine into weighted risk score
     # ==========================================================================
     print("\nCalculating composite risk scores...")
     print(f"  Weights: Vegetation={WEIGHTS['vegetation']:.0%}, "
           f"Proximity={WEIGHTS['proximity']:.0%}, Length={WEIGHTS['length']:.0%}")
 
-    lines['risk_score'] = (
-        lines['veg_norm'] * WEIGHTS['vegetation'] +
-        lines['prox_norm'] * WEIGHTS['proximity'] +
-        lines['length_norm'] * WEIGHTS['length']
+    veg = lines['canopy_sqft_per_ft'].to_numpy()
+    prox = lines['proximity_score'].to_numpy(np.float32)
+    length = lines['length_ft'].to_numpy()
+    print(f"  Vegetation: min={veg.min():.3f}, max={veg.max():.3f} sq ft/ft")
+    print(f"  Proximity: min={prox.min():.0f}, max={prox.max():.0f}")
+    print(f"  Length: min={length.min():.1f}, max={length.max():.1f} ft")
+
+    # Vegetation load and segment length are min-max normalized (higher = more risk);
+    # proximity score (3/2/1) only needs dividing by 3 so 3 -> 1.0, 1 -> 0.33.
+    # Normalization is fused into the weighted sum, so no *_norm columns are kept.
+    lines['risk_score'] = compute_risk_scores(
+        veg, prox, length,
+        WEIGHTS['vegetation'], WEIGHTS['proximity'], WEIGHTS['length']
     )
 
     # ==========================================================================
-    # Step 3: Classify into risk tiers
+    # Step 2: Classify into risk tiers
     # ==========================================================================
     print("\nClassifying risk tiers...")
 
-    # Calculate percentile thresholds
-    high_threshold = np.percentile(lines['risk_score'], TIER_THRESHOLDS['high'])
-    medium_threshold = np.percentile(lines['risk_score'], TIER_THRESHOLDS['medium'])
+    # Calculate percentile thresholds (one partial sort for both)
+    high_threshold, medium_threshold = percentiles_partitioned(
+        lines['risk_score'].to_numpy(), [TIER_THRESHOLDS['high'], TIER_THRESHOLDS['medium']]
+    )
 
     print(f"  High threshold (P{TIER_THRESHOLDS['high']}): {high_threshold:.4f}")
     print(f"  Medium threshold (P{TIER_THRESHOLDS['medium']}): {medium_threshold:.4f}")
 
-    # Apply classification
-    lines['risk_tier'] = lines['risk_score'].apply(
-        lambda x: classify_risk_tier(x, high_threshold, medium_threshold)
+    # Apply classification: digitize gives the tier code directly
+    # (0 = < medium, 1 = < high, 2 = >= high), so no string array is built
+    scores = lines['risk_score'].to_numpy()
+    tier_codes = np.digitize(scores, [medium_threshold, high_threshold]).astype(np.int8)
+    lines['risk_tier'] = pd.Categorical.from_codes(
+        tier_codes, categories=['Low', 'Medium', 'High'], ordered=True
     )
 
     # ==========================================================================
-    # Step 4: Create priority ranking
+    # Step 3: Create priority ranking
     # ==========================================================================
     print("\nCreating priority ranking...")
-    lines['priority_rank'] = lines['risk_score'].rank(ascending=False, method='first').astype(int)
+    # Stable descending sort, so ties keep file order (same as rank(method='first'))
+    scores = lines['risk_score'].to_numpy()
+    order = np.argsort(-scores, kind='stable')
+    ranks = np.empty(len(scores), dtype=np.int32)
+    ranks[order] = np.arange(1, len(scores) + 1, dtype=np.int32)
+    lines['priority_rank'] = ranks
 
     # ==========================================================================
     # Export results
     # ==========================================================================
     print("\nExporting results...")
-    output_path = PROCESSED_DIR / "scored_segments.gpkg"
-    lines.to_file(output_path, driver="GPKG")
+    output_path = PROCESSED_DIR / "scored_segments.parquet"
+    lines.to_parquet(output_path, compression="zstd")
     print(f"  Saved: {output_path}")
 
+    # GeoPackage copy for GIS users
+    gis_path = PROCESSED_DIR / "scored_segments.gpkg"
+    pyogrio.write_dataframe(lines, gis_path, driver="GPKG", use_arrow=True,
+                            layer_options={"SPATIAL_INDEX": "YES"})
+    print(f"  Saved: {gis_path}")
+
     # ==========================================================================
     # Summary statistics
     # ==========================================================================
@@ -154,7 +191,7 @@ def main():
     print("="*60)
 
     tier_counts = lines['risk_tier'].value_counts()
-    tier_lengths = lines.groupby('risk_tier')['length_ft'].sum() / 5280  # Convert to miles
+    tier_lengths = lines.groupby('risk_tier', observed=False)['length_ft'].sum() / 5280  # Convert to miles
 
     print(f"\n  Risk Score Statistics:")
     print(f"    Mean: {lines['risk_score'].mean():.4f}")
@@ -206,7 +243,7 @@ def main():
 | Medium | {tier_counts.get('Medium', 0):,} | {tier_counts.get('Medium', 0)/len(lines)*100:.1f}% | {tier_lengths.get('Medium', 0):.1f} |
 | Low | {tier_counts.get('Low', 0):,} | {tier_counts.get('Low', 0)/len(lines)*100:.1f}% | {tier_lengths.get('Low', 0):.1f} |
 
-Output: `scored_segments.gpkg`
+Output: `scored_segments.parquet` (plus `scored_segments.gpkg` for GIS)
 
 """
     with open(DOCS_DIR / "process_log.md", "a") as f:
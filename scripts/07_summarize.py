@@ -11,7 +11,9 @@ This script creates summary outputs:
 """
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 from pathlib import Path
 from datetime import datetime
 
@@ -24,6 +26,9 @@ PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 OUTPUTS_DIR = PROJECT_ROOT / "outputs"
 DOCS_DIR = PROJECT_ROOT / "docs"
 
+# Planar CRS of the processed layers (WA State Plane North, feet)
+TARGET_CRS = "EPSG:2926"
+
 # Number of top priority segments to export
 TOP_N_SEGMENTS = 25
 
@@ -31,6 +36,19 @@ TOP_N_SEGMENTS = 25
 # Functions
 # =============================================================================
 
+def ensure_projected(gdf: gpd.GeoDataFrame, name: str) -> gpd.GeoDataFrame:
+    """
+    Make sure gdf is in the planar TARGET_CRS (feet) before any distance or
+    centroid work, reprojecting once up front if it is not.
+    """
+    if gdf.crs is None:
+        raise ValueError(f"{name} has no CRS - rerun 02_prep_data.py")
+    if gdf.crs.is_geographic or gdf.crs.to_string() != TARGET_CRS:
+        print(f"  {name}: Reprojecting to {TARGET_CRS}")
+        gdf = gdf.to_crs(TARGET_CRS)
+    return gdf
+
+
 def aggregate_by_neighborhood(segments: gpd.GeoDataFrame,
                               neighborhoods: gpd.GeoDataFrame) -> pd.DataFrame:
     """
@@ -39,36 +57,34 @@ def aggregate_by_neighborhood(segments: gpd.GeoDataFrame,
     print("\nAggregating by neighborhood...")
 
     # Spatial join - use segment centroids to assign to neighborhoods
-    segments = segments.copy()
-    segments['centroid'] = segments.geometry.centroid
-
-    # Create temporary GeoDataFrame with centroids
-    centroids_gdf = gpd.GeoDataFrame(
-        segments.drop(columns=['geometry']),
-        geometry=segments['centroid'],
-        crs=segments.crs
-    )
+    # (centroid coordinates were stored by 05_proximity_analysis as cx/cy)
+    centroids = gpd.points_from_xy(segments['cx'], segments['cy'], crs=segments.crs)
 
-    # Spatial join to neighborhoods
-    joined = gpd.sjoin(
-        centroids_gdf,
-        neighborhoods[['geometry', 'neighborhood']],
-        how='left',
-        predicate='within'
-    )
+    # Point-in-polygon straight off an STRtree of the neighborhoods;
+    # query returns (input index, tree index) pairs where centroid within polygon
+    tree = shapely.STRtree(neighborhoods.geometry.to_numpy())
+    segment_idx, hood_idx = tree.query(np.asarray(centroids), predicate='within')
 
     # Handle segments that didn't fall within any neighborhood (boundary cases)
-    null_count = joined['neighborhood'].isna().sum()
+    hood_names = np.full(len(segments), 'Outside City Limits', dtype=object)
+    hood_names[segment_idx] = neighborhoods['neighborhood'].to_numpy()[hood_idx]
+    null_count = len(segments) - len(np.unique(segment_idx))
     if null_count > 0:
         print(f"  Note: {null_count} segments not within neighborhood boundaries (boundary cases)")
-        joined['neighborhood'] = joined['neighborhood'].fillna('Outside City Limits')
+
+    joined = segments.drop(columns=['geometry'])
+    joined['neighborhood'] = hood_names
+
+    # Precompute high-risk mask and length so every aggregate is a built-in reduction
+    joined['is_high'] = joined['risk_tier'] == 'High'
+    joined['high_len'] = joined['length_ft'].where(joined['is_high'], 0.0)
 
     # Calculate statistics by neighborhood
     stats = joined.groupby('neighborhood').agg(
         total_segments=('segment_id', 'count'),
         total_length_ft=('length_ft', 'sum'),
-        high_risk_segments=('risk_tier', lambda x: (x == 'High').sum()),
-        high_risk_length_ft=('length_ft', lambda x: x[joined.loc[x.index, 'risk_tier'] == 'High'].sum()),
+        high_risk_segments=('is_high', 'sum'),
+        high_risk_length_ft=('high_len', 'sum'),
         avg_risk_score=('risk_score', 'mean'),
         max_risk_score=('risk_score', 'max'),
         avg_canopy_per_ft=('canopy_sqft_per_ft', 'mean')
@@ -91,8 +107,17 @@ def export_priority_segments(segments: gpd.GeoDataFrame, n: int) -> pd.DataFrame
     """
     print(f"\nExporting top {n} priority segments...")
 
-    # Get top N by priority rank
-    top_segments = segments.nsmallest(n, 'priority_rank').copy()
+    # Get top N by priority rank - partition out the N lowest ranks (O(N)),
+    # then sort only those
+    ranks = segments['priority_rank'].to_numpy()
+    n = min(n, len(ranks))
+    if n == 0:
+        # argpartition needs at least one row; export an empty table instead
+        top_segments = segments.iloc[:0]
+    else:
+        idx = np.argpartition(ranks, n - 1)[:n]
+        idx = idx[np.argsort(ranks[idx])]
+        top_segments = segments.iloc[idx]
 
     # Select and rename columns for export
     export_cols = {
@@ -120,7 +145,13 @@ def export_priority_segments(segments: gpd.GeoDataFrame, n: int) -> pd.DataFrame
     return export_df
 
 
-def main():
+def main(segments: gpd.GeoDataFrame = None):
+    """
+    Run the summary stage.
+
+    Args:
+        segments: Output of stage 06; read from scored_segments.parquet if None
+    """
     print("\n" + "="*60)
     print("07_SUMMARIZE - Create Summary Outputs")
     print("="*60)
@@ -130,15 +161,26 @@ def main():
 
     # Load data
     print("\nLoading data...")
-    segments_path = PROCESSED_DIR / "scored_segments.gpkg"
     neighborhoods_path = PROCESSED_DIR / "neighborhoods.gpkg"
 
-    segments = gpd.read_file(segments_path)
-    neighborhoods = gpd.read_file(neighborhoods_path)
+    if segments is None:
+        segments = gpd.read_parquet(PROCESSED_DIR / "scored_segments.parquet")
+    neighborhoods = gpd.read_file(neighborhoods_path, engine="pyogrio")
 
     print(f"  Loaded {len(segments):,} scored segments")
     print(f"  Loaded {len(neighborhoods):,} neighborhoods")
 
+    # Centroid cx/cy and neighborhood polygons must share the planar CRS;
+    # cx/cy were written by 05 in TARGET_CRS, so segments can't just be reprojected
+    if segments.crs is None or segments.crs.to_string() != TARGET_CRS:
+        raise ValueError(f"Scored segments are not in {TARGET_CRS} - rerun 05_proximity_analysis.py")
+    neighborhoods = ensure_projected(neighborhoods, "Neighborhoods")
+
+    # Downcast metrics before the join/groupby to halve the bytes they move
+    for col in ['canopy_sqft_per_ft', 'length_ft', 'risk_score']:
+        segments[col] = segments[col].astype(np.float32)
+    segments['proximity_score'] = segments['proximity_score'].astype(np.int8)
+
     # ==========================================================================
     # Neighborhood Summary
     # ==========================================================================
@@ -188,6 +230,10 @@ def main():
 
     # Update process log
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    top5_rows = "\n".join(
+        f"| {r.neighborhood} | {r.total_miles:.1f} | {r.high_risk_miles:.1f} | {r.pct_high_risk:.1f}% |"
+        for r in neighborhood_stats.head(5).itertuples()
+    )
     log_content = f"""
 ---
 
@@ -206,11 +252,8 @@ def main():
 ### Top 5 High-Risk Neighborhoods
 | Neighborhood | Total Miles | High Risk Miles | % High Risk |
 |-------------|-------------|-----------------|-------------|
-"""
-    for _, row in neighborhood_stats.head(5).iterrows():
-        log_content += f"| {row['neighborhood']} | {row['total_miles']:.1f} | {row['high_risk_miles']:.1f} | {row['pct_high_risk']:.1f}% |\n"
+{top5_rows}
 
-    log_content += f"""
 ### Citywide Summary
 - Total overhead line miles: {total_miles:.1f}
 - High risk miles: {high_risk_miles:.1f} ({pct_high_risk:.1f}%)
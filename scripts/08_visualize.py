@@ -6,14 +6,20 @@ Seattle Area Case Study
 This script creates map visualizations:
 - Citywide risk map with OpenStreetMap basemap
 - Detail map of highest-risk neighborhood
-- All neighborhood labels included
+- Neighborhood labels (tiny neighborhoods skipped to avoid overlaps)
 """
 
+import argparse
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as pe
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.colors import to_rgba
 from matplotlib.lines import Line2D
+from matplotlib.path import Path as MplPath
 from pathlib import Path
 from datetime import datetime
 import contextily as ctx
@@ -31,6 +37,7 @@ PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 OUTPUTS_DIR = PROJECT_ROOT / "outputs"
 MAPS_DIR = PROJECT_ROOT / "maps"
 DOCS_DIR = PROJECT_ROOT / "docs"
+TILE_CACHE_DIR = PROJECT_ROOT / ".cache" / "basemap_tiles"
 
 # Improved color scheme - higher contrast
 RISK_COLORS = {
@@ -39,30 +46,115 @@ RISK_COLORS = {
     'Low': '#31a354'        # Forest green
 }
 
+# Segment styling per risk tier: (linewidth, alpha) - thicker lines for higher risk
+CITYWIDE_STYLE = {'Low': (0.3, 0.5), 'Medium': (0.6, 0.7), 'High': (1.2, 0.9)}
+DETAIL_STYLE = {'Low': (1.0, 0.6), 'Medium': (2.0, 0.8), 'High': (3.5, 0.95)}
+
 # Map styling
 FIGURE_DPI = 300
 WEB_MERCATOR = "EPSG:3857"
 
+# zlib level for PNG output - 1 encodes several times faster than the default 6
+# for a somewhat larger file
+PNG_COMPRESS_LEVEL = 1
+
+# Douglas-Peucker tolerance (Web Mercator meters) applied before plotting -
+# below a pixel at each map's scale, so vertices are dropped without visible change
+CITYWIDE_SIMPLIFY_M = 3.0
+DETAIL_SIMPLIFY_M = 0.5
+
+# Citywide labels are skipped for neighborhoods smaller than this fraction of
+# the median neighborhood area (their 5pt labels only collide with neighbors)
+LABEL_MIN_AREA_FRACTION = 0.25
+
+# Keep downloaded basemap tiles on disk so re-runs don't fetch them again
+ctx.set_cache_dir(str(TILE_CACHE_DIR))
+
 # =============================================================================
 # Functions
 # =============================================================================
 
-def create_citywide_risk_map(segments: gpd.GeoDataFrame,
-                              neighborhoods: gpd.GeoDataFrame,
-                              facilities: gpd.GeoDataFrame,
-                              save_path: Path) -> plt.Figure:
+def within_bounds(gdf: gpd.GeoDataFrame, bounds: tuple) -> gpd.GeoDataFrame:
+    """
+    Rows of gdf intersecting the (minx, miny, maxx, maxy) box, found through
+    the spatial index (GeoDataFrame.cx would test every geometry). Row order is kept.
+    """
+    idx = gdf.sindex.query(shapely.box(*bounds), predicate='intersects')
+    return gdf.iloc[np.sort(idx)]
+
+
+def add_risk_segments(ax: plt.Axes, segments_wm: gpd.GeoDataFrame, style: dict,
+                      tiers: tuple = ('Low', 'Medium', 'High'), rasterized: bool = False):
+    """
+    Draw segments as a single matplotlib collection, colored and sized by risk tier.
+
+    style maps tier -> (linewidth, alpha) (CITYWIDE_STYLE / DETAIL_STYLE); only
+    the given tiers are drawn, in that order, so later tiers (High) sit on top.
+    Buffer polygons are drawn as a PathCollection (holes included), plain
+    lines as a LineCollection.
+    rasterized=True draws the collection as an image in vector outputs.
+    """
+    seg_tiers = segments_wm['risk_tier'].astype(str).to_numpy()
+    tier_rows = [np.flatnonzero(seg_tiers == tier) for tier in tiers]
+    order = np.concatenate(tier_rows)
+    if len(order) == 0:
+        return None
+    codes = np.repeat(np.arange(len(tiers)), [len(rows) for rows in tier_rows])
+
+    # One entry per single-part geometry (multi-part segments are split up);
+    # empties (e.g. collapsed by simplify) have no coordinates and are dropped
+    parts, part_idx = shapely.get_parts(segments_wm.geometry.to_numpy()[order], return_index=True)
+    non_empty = ~shapely.is_empty(parts)
+    parts = parts[non_empty]
+    if len(parts) == 0:
+        return None
+    part_codes = codes[part_idx[non_empty]]
+
+    tier_colors = np.array([to_rgba(RISK_COLORS[tier], style[tier][1]) for tier in tiers])
+    tier_widths = np.array([style[tier][0] for tier in tiers])
+    colors = tier_colors[part_codes]
+    widths = tier_widths[part_codes]
+
+    # Pull every vertex out in one (N, 2) buffer and split it per geometry,
+    # instead of building a coordinate list per geometry in Python
+    polygonal = np.all(shapely.get_type_id(parts) == 3)  # Polygon
+    if polygonal:
+        # Exterior and interior rings of each polygon go into one compound
+        # path (a MOVETO per ring), so holes stay unfilled. normalize() orients
+        # exteriors clockwise and holes counter-clockwise for the nonzero fill rule.
+        rings, ring_part = shapely.get_rings(shapely.normalize(parts), return_index=True)
+        coords, coord_ring = shapely.get_coordinates(rings, return_index=True)
+        ring_starts = np.flatnonzero(np.diff(coord_ring, prepend=-1))
+        path_codes = np.full(len(coords), MplPath.LINETO, dtype=MplPath.code_type)
+        path_codes[ring_starts] = MplPath.MOVETO
+        path_codes[np.append(ring_starts[1:], len(coords)) - 1] = MplPath.CLOSEPOLY
+        splits = np.flatnonzero(np.diff(ring_part[coord_ring])) + 1
+        paths = [MplPath(vertices, vertex_codes) for vertices, vertex_codes in
+                 zip(np.split(coords, splits), np.split(path_codes, splits))]
+        collection = PathCollection(paths, facecolors=colors, edgecolors=colors, linewidths=widths)
+    else:
+        coords, coord_idx = shapely.get_coordinates(parts, return_index=True)
+        paths = np.split(coords, np.flatnonzero(np.diff(coord_idx)) + 1)
+        collection = LineCollection(paths, colors=colors, linewidths=widths)
+
+    collection.set_rasterized(rasterized)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
+
+
+def create_citywide_risk_map(segments_wm: gpd.GeoDataFrame,
+                              neighborhoods_wm: gpd.GeoDataFrame,
+                              facilities_wm: gpd.GeoDataFrame,
+                              save_path: Path,
+                              dpi: int = FIGURE_DPI) -> Path:
     """
     Create citywide map with OpenStreetMap basemap and neighborhood labels.
-    Focused on Seattle city boundaries.
+    Focused on Seattle city boundaries. Layers must already be in Web Mercator.
+    The figure is closed after saving; returns save_path.
     """
     print("\nCreating citywide risk map...")
 
-    # Reproject to Web Mercator for basemap compatibility
-    print("  Reprojecting to Web Mercator...")
-    segments_wm = segments.to_crs(WEB_MERCATOR)
-    neighborhoods_wm = neighborhoods.to_crs(WEB_MERCATOR)
-    facilities_wm = facilities.to_crs(WEB_MERCATOR)
-
     # Get Seattle city bounds from neighborhoods (dissolve all neighborhoods)
     seattle_bounds = neighborhoods_wm.total_bounds  # [minx, miny, maxx, maxy]
 
@@ -70,6 +162,12 @@ def create_citywide_risk_map(segments: gpd.GeoDataFrame,
     pad_x = (seattle_bounds[2] - seattle_bounds[0]) * 0.05
     pad_y = (seattle_bounds[3] - seattle_bounds[1]) * 0.05
 
+    # Keep only segments inside the padded Seattle box so matplotlib gets fewer paths
+    seg_visible = within_bounds(segments_wm, (seattle_bounds[0] - pad_x, seattle_bounds[1] - pad_y,
+                                              seattle_bounds[2] + pad_x, seattle_bounds[3] + pad_y))
+    seg_visible = seg_visible.assign(geometry=shapely.simplify(
+        seg_visible.geometry.to_numpy(), CITYWIDE_SIMPLIFY_M, preserve_topology=False))
+
     # Create figure
     fig, ax = plt.subplots(1, 1, figsize=(14, 18))
 
@@ -84,26 +182,9 @@ def create_citywide_risk_map(segments: gpd.GeoDataFrame,
 
     # Plot segments by risk tier (Low first, then Medium, then High)
     print("  Plotting segments by risk tier...")
-    for tier in ['Low', 'Medium', 'High']:
-        tier_segments = segments_wm[segments_wm['risk_tier'] == tier]
-        if len(tier_segments) > 0:
-            # Thicker lines for higher risk
-            if tier == 'Low':
-                linewidth = 0.3
-                alpha = 0.5
-            elif tier == 'Medium':
-                linewidth = 0.6
-                alpha = 0.7
-            else:  # High
-                linewidth = 1.2
-                alpha = 0.9
-
-            tier_segments.plot(
-                ax=ax,
-                color=RISK_COLORS[tier],
-                linewidth=linewidth,
-                alpha=alpha
-            )
+    # Low/Medium are rasterized (thousands of faint paths); High stays vector
+    add_risk_segments(ax, seg_visible, CITYWIDE_STYLE, tiers=('Low', 'Medium'), rasterized=True)
+    add_risk_segments(ax, seg_visible, CITYWIDE_STYLE, tiers=('High',))
 
     # Plot critical facilities
     hospitals = facilities_wm[facilities_wm['facility_type'] == 'hospital']
@@ -130,21 +211,29 @@ def create_citywide_risk_map(segments: gpd.GeoDataFrame,
 
     # Add neighborhood labels
     print("  Adding neighborhood labels...")
-    for idx, row in neighborhoods_wm.iterrows():
-        if pd.notna(row.get('neighborhood')):
-            centroid = row.geometry.centroid
-            ax.annotate(
-                row['neighborhood'],
-                xy=(centroid.x, centroid.y),
-                fontsize=5,
-                ha='center',
-                va='center',
-                color='#333333',
-                fontweight='bold',
-                path_effects=[
-                    pe.withStroke(linewidth=2, foreground='white')
-                ]
-            )
+    # Label positions in one vectorized call; point_on_surface (GeoPandas'
+    # representative_point) always falls inside the polygon, unlike the
+    # centroid of a concave neighborhood
+    hood_geoms = neighborhoods_wm.geometry.to_numpy()
+    label_pts = shapely.point_on_surface(hood_geoms)
+    label_xs, label_ys = shapely.get_x(label_pts), shapely.get_y(label_pts)
+    names = neighborhoods_wm['neighborhood'].to_numpy()
+
+    # Skip unnamed and tiny neighborhoods (each halo label is two text renders)
+    areas = shapely.area(hood_geoms)
+    keep = pd.notna(names) & (areas > np.median(areas) * LABEL_MIN_AREA_FRACTION)
+    label_halo = [pe.withStroke(linewidth=2, foreground='white')]
+    for x, y, name in zip(label_xs[keep], label_ys[keep], names[keep]):
+        ax.annotate(
+            name,
+            xy=(x, y),
+            fontsize=5,
+            ha='center',
+            va='center',
+            color='#333333',
+            fontweight='bold',
+            path_effects=label_halo
+        )
 
     # Set map bounds to focus on Seattle
     ax.set_xlim(seattle_bounds[0] - pad_x, seattle_bounds[2] + pad_x)
@@ -179,8 +268,8 @@ def create_citywide_risk_map(segments: gpd.GeoDataFrame,
     )
 
     # Subtitle with statistics
-    total_miles = segments['length_ft'].sum() / 5280
-    high_risk_miles = segments[segments['risk_tier'] == 'High']['length_ft'].sum() / 5280
+    total_miles = segments_wm['length_ft'].sum() / 5280
+    high_risk_miles = segments_wm[segments_wm['risk_tier'] == 'High']['length_ft'].sum() / 5280
     subtitle = f'Total: {total_miles:.0f} miles of overhead lines  |  High Risk: {high_risk_miles:.0f} miles ({high_risk_miles/total_miles*100:.0f}%)'
     ax.text(
         0.5, -0.02,
@@ -192,39 +281,45 @@ def create_citywide_risk_map(segments: gpd.GeoDataFrame,
     )
 
     ax.set_axis_off()
-    plt.tight_layout()
 
     # Save
     print("  Saving map...")
-    fig.savefig(save_path, dpi=FIGURE_DPI, bbox_inches='tight',
-                facecolor='white', edgecolor='none')
+    fig.savefig(save_path, dpi=dpi, bbox_inches='tight',
+                facecolor='white', edgecolor='none',
+                pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
     print(f"  Saved: {save_path}")
 
-    return fig
+    # Release the full-resolution canvas now rather than at the end of the run
+    plt.close(fig)
+
+    return save_path
 
 
-def create_detail_map(segments: gpd.GeoDataFrame,
+def create_detail_map(segments_wm: gpd.GeoDataFrame,
+                      neighborhoods_wm: gpd.GeoDataFrame,
+                      facilities_wm: gpd.GeoDataFrame,
+                      centroid_tree: shapely.STRtree,
+                      risk_tiers: np.ndarray,
                       neighborhoods: gpd.GeoDataFrame,
-                      facilities: gpd.GeoDataFrame,
                       neighborhood_name: str,
-                      save_path: Path) -> plt.Figure:
+                      save_path: Path,
+                      dpi: int = FIGURE_DPI) -> Path:
     """
     Create detail map of a specific neighborhood with basemap.
+    The *_wm layers are drawn (Web Mercator); the statistics use an STRtree
+    of segment centroids (risk_tiers in the same order) and neighborhoods,
+    both in the original projected CRS.
+    The figure is closed after saving; returns save_path (None if not found).
     """
     print(f"\nCreating detail map for {neighborhood_name}...")
 
-    # Reproject to Web Mercator
-    segments_wm = segments.to_crs(WEB_MERCATOR)
-    neighborhoods_wm = neighborhoods.to_crs(WEB_MERCATOR)
-    facilities_wm = facilities.to_crs(WEB_MERCATOR)
-
     # Get the neighborhood boundary
     hood = neighborhoods_wm[neighborhoods_wm['neighborhood'] == neighborhood_name]
     if len(hood) == 0:
         print(f"  Warning: Neighborhood '{neighborhood_name}' not found")
         return None
 
-    hood_geom = hood.geometry.iloc[0]
+    hood_geom = hood.geometry.values[0]
 
     # Get bounding box with padding
     minx, miny, maxx, maxy = hood_geom.bounds
@@ -232,42 +327,27 @@ def create_detail_map(segments: gpd.GeoDataFrame,
     pad_y = (maxy - miny) * 0.15
     bounds = (minx - pad_x, miny - pad_y, maxx + pad_x, maxy + pad_y)
 
-    # Filter data within bounds
-    segments_bbox = segments_wm.cx[bounds[0]:bounds[2], bounds[1]:bounds[3]]
-    facilities_bbox = facilities_wm.cx[bounds[0]:bounds[2], bounds[1]:bounds[3]]
+    # Filter data within bounds (spatial index queries)
+    segments_bbox = within_bounds(segments_wm, bounds)
+    segments_bbox = segments_bbox.assign(geometry=shapely.simplify(
+        segments_bbox.geometry.to_numpy(), DETAIL_SIMPLIFY_M, preserve_topology=False))
+    facilities_bbox = within_bounds(facilities_wm, bounds)
 
     # Create figure
     fig, ax = plt.subplots(1, 1, figsize=(14, 14))
 
     # Plot nearby neighborhoods for context
-    nearby = neighborhoods_wm[neighborhoods_wm['neighborhood'] != neighborhood_name]
-    nearby_bbox = nearby.cx[bounds[0]:bounds[2], bounds[1]:bounds[3]]
+    hoods_bbox = within_bounds(neighborhoods_wm, bounds)
+    nearby_bbox = hoods_bbox[hoods_bbox['neighborhood'] != neighborhood_name]
     nearby_bbox.plot(ax=ax, facecolor='#f0f0f0', edgecolor='#999999',
                      linewidth=0.5, alpha=0.5)
 
     # Plot target neighborhood boundary
     hood.plot(ax=ax, facecolor='none', edgecolor='#333333', linewidth=2.5)
 
-    # Plot segments by risk tier
-    for tier in ['Low', 'Medium', 'High']:
-        tier_segments = segments_bbox[segments_bbox['risk_tier'] == tier]
-        if len(tier_segments) > 0:
-            if tier == 'Low':
-                linewidth = 1.0
-                alpha = 0.6
-            elif tier == 'Medium':
-                linewidth = 2.0
-                alpha = 0.8
-            else:  # High
-                linewidth = 3.5
-                alpha = 0.95
-
-            tier_segments.plot(
-                ax=ax,
-                color=RISK_COLORS[tier],
-                linewidth=linewidth,
-                alpha=alpha
-            )
+    # Plot segments by risk tier; Low/Medium are rasterized, High stays vector
+    add_risk_segments(ax, segments_bbox, DETAIL_STYLE, tiers=('Low', 'Medium'), rasterized=True)
+    add_risk_segments(ax, segments_bbox, DETAIL_STYLE, tiers=('High',))
 
     # Plot facilities
     if len(facilities_bbox) > 0:
@@ -322,10 +402,12 @@ def create_detail_map(segments: gpd.GeoDataFrame,
 
     # Calculate stats for this neighborhood (use original CRS data)
     hood_orig = neighborhoods[neighborhoods['neighborhood'] == neighborhood_name]
-    hood_geom_orig = hood_orig.geometry.iloc[0]
-    hood_segments = segments[segments.geometry.centroid.within(hood_geom_orig)]
-    total_segs = len(hood_segments)
-    high_segs = (hood_segments['risk_tier'] == 'High').sum()
+    hood_geom_orig = hood_orig.geometry.values[0]
+    shapely.prepare(hood_geom_orig)
+    # 'contains' is tested as hood.contains(centroid), i.e. centroid within hood
+    hood_idx = centroid_tree.query(hood_geom_orig, predicate='contains')
+    total_segs = len(hood_idx)
+    high_segs = (risk_tiers[hood_idx] == 'High').sum()
     pct_high = high_segs / total_segs * 100 if total_segs > 0 else 0
 
     # Title
@@ -337,14 +419,17 @@ def create_detail_map(segments: gpd.GeoDataFrame,
     )
 
     ax.set_axis_off()
-    plt.tight_layout()
 
     # Save
-    fig.savefig(save_path, dpi=FIGURE_DPI, bbox_inches='tight',
-                facecolor='white', edgecolor='none')
+    fig.savefig(save_path, dpi=dpi, bbox_inches='tight',
+                facecolor='white', edgecolor='none',
+                pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
     print(f"  Saved: {save_path}")
 
-    return fig
+    # Release the full-resolution canvas now rather than at the end of the run
+    plt.close(fig)
+
+    return save_path
 
 
 def find_highest_risk_neighborhood(neighborhood_summary_path: Path) -> str:
@@ -355,29 +440,52 @@ def find_highest_risk_neighborhood(neighborhood_summary_path: Path) -> str:
     return highest_risk
 
 
-def main():
+def main(dpi: int = FIGURE_DPI):
     print("\n" + "="*60)
     print("08_VISUALIZE - Create Improved Map Visualizations")
     print("="*60)
 
-    # Ensure output directory exists
+    # Ensure output directories exist
     MAPS_DIR.mkdir(parents=True, exist_ok=True)
+    DOCS_DIR.mkdir(parents=True, exist_ok=True)
+    log_path = DOCS_DIR / "process_log.md"
 
     # Load data
     print("\nLoading data...")
-    segments = gpd.read_file(PROCESSED_DIR / "scored_segments.gpkg")
-    neighborhoods = gpd.read_file(PROCESSED_DIR / "neighborhoods.gpkg")
-    facilities = gpd.read_file(PROCESSED_DIR / "critical_facilities.gpkg")
+    # GeoParquet, reading only the columns the maps use
+    segments = gpd.read_parquet(PROCESSED_DIR / "scored_segments.parquet",
+                                columns=['geometry', 'risk_tier', 'length_ft', 'cx', 'cy'])
+    neighborhoods = gpd.read_parquet(PROCESSED_DIR / "neighborhoods.parquet",
+                                     columns=['geometry', 'neighborhood'])
+    facilities = gpd.read_parquet(PROCESSED_DIR / "critical_facilities.parquet",
+                                  columns=['geometry', 'facility_type'])
 
     print(f"  Loaded {len(segments):,} scored segments")
     print(f"  Loaded {len(neighborhoods):,} neighborhoods")
     print(f"  Loaded {len(facilities):,} critical facilities")
 
+    # Reproject to Web Mercator once for basemap compatibility (shared by both maps)
+    print("\nReprojecting to Web Mercator...")
+    segments_wm = segments.to_crs(WEB_MERCATOR)
+    neighborhoods_wm = neighborhoods.to_crs(WEB_MERCATOR)
+    facilities_wm = facilities.to_crs(WEB_MERCATOR)
+
+    # GeoPandas builds .sindex lazily on first access; build all three now so
+    # every bbox query in the map functions hits a ready STRtree
+    for layer in (segments_wm, neighborhoods_wm, facilities_wm):
+        layer.sindex
+
+    # STRtree of segment centroids (stored by 05_proximity_analysis as cx/cy)
+    # for neighborhood statistics - built once, reusable for any detail map
+    centroid_tree = shapely.STRtree(shapely.points(segments['cx'].to_numpy(),
+                                                   segments['cy'].to_numpy()))
+    risk_tiers = segments['risk_tier'].astype(str).to_numpy()
+
     # ==========================================================================
     # Map 1: Citywide Risk Map
     # ==========================================================================
     citywide_path = MAPS_DIR / "citywide_risk_map.png"
-    create_citywide_risk_map(segments, neighborhoods, facilities, citywide_path)
+    create_citywide_risk_map(segments_wm, neighborhoods_wm, facilities_wm, citywide_path, dpi=dpi)
 
     # ==========================================================================
     # Map 2: Detail Map of Highest-Risk Neighborhood
@@ -388,7 +496,8 @@ def main():
     print(f"\n  Highest risk neighborhood: {highest_risk_hood}")
 
     detail_path = MAPS_DIR / "detail_high_risk_area.png"
-    create_detail_map(segments, neighborhoods, facilities, highest_risk_hood, detail_path)
+    create_detail_map(segments_wm, neighborhoods_wm, facilities_wm, centroid_tree, risk_tiers,
+                      neighborhoods, highest_risk_hood, detail_path, dpi=dpi)
 
     # ==========================================================================
     # Summary
@@ -411,7 +520,7 @@ def main():
 ### Improvements Made
 - Added OpenStreetMap basemap (CartoDB Positron)
 - Improved color contrast (bright red, golden yellow, forest green)
-- Added all neighborhood labels with white halo
+- Added neighborhood labels with white halo (smallest neighborhoods skipped)
 - Increased line widths for better visibility
 - Larger figure size and improved legend
 
@@ -420,15 +529,16 @@ def main():
 - `detail_high_risk_area.png` - Zoomed view of {highest_risk_hood}
 
 """
-    with open(DOCS_DIR / "process_log.md", "a") as f:
+    with log_path.open("a") as f:
         f.write(log_content)
     print("\nProcess log updated.")
 
-    # Close figures to free memory
-    plt.close('all')
-
     print("\nVisualization complete!")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create map visualizations")
+    parser.add_argument("--dpi", type=int, default=FIGURE_DPI,
+                        help=f"output resolution (default {FIGURE_DPI}; e.g. 150 for quick drafts)")
+    args = parser.parse_args()
+    main(dpi=args.dpi)
@@ -0,0 +1,48 @@
+"""
+run_pipeline.py
+Vegetation-Infrastructure Conflict Prioritization Model
+Seattle City Light Portfolio Project
+
+Runs stages 04-07 in one Python process, passing the line segment
+GeoDataFrame from stage to stage in memory:
+- 04 canopy intersection (reads line_buffers.parquet)
+- 05 proximity analysis
+- 06 risk scoring (writes scored_segments.parquet / .gpkg)
+- 07 summaries (writes outputs/*.csv)
+
+lines_with_canopy.parquet and lines_with_proximity.parquet are skipped
+unless --write-intermediates is given. Stages 01-03 and 08 are run on
+their own as before.
+"""
+
+import argparse
+import importlib
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+def load_stage(module_name: str):
+    """Import a numbered stage script (names starting with a digit need importlib)."""
+    return importlib.import_module(module_name)
+
+
+def run_pipeline(write_intermediates: bool = False):
+    """Run stages 04-07, threading the segments GeoDataFrame through each main()."""
+    canopy = load_stage("04_canopy_intersection")
+    proximity = load_stage("05_proximity_analysis")
+    scoring = load_stage("06_risk_scoring")
+    summarize = load_stage("07_summarize")
+
+    lines = canopy.main(write_output=write_intermediates)
+    lines = proximity.main(lines, write_output=write_intermediates)
+    segments = scoring.main(lines)
+    return summarize.main(segments)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run stages 04-07 in memory")
+    parser.add_argument("--write-intermediates", action="store_true",
+                        help="also save lines_with_canopy / lines_with_proximity parquet files")
+    args = parser.parse_args()
+    run_pipeline(write_intermediates=args.write_intermediates)